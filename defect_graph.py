@@ -1,137 +1,93 @@
 import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment
+import pandas as pd
+from openpyxl.styles import Font, PatternFill, Alignment, NamedStyle
 from openpyxl.chart import PieChart, Reference
 from openpyxl.chart.label import DataLabelList
 import os
 import sys
 import time
-from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from pqa_io import load_defects, analyze_grouped_defects
+
+# 分组数达到该值才启用多进程构建，组少时进程开销得不偿失
+PARALLEL_GROUP_THRESHOLD = 8
+
+# 图表定位用的列号→列字母映射，预计算避免在放置循环里重复换算
+COL_LETTER = {i: openpyxl.utils.get_column_letter(i) for i in range(1, 27)}
+
+# 工序标题字体，模块级复用避免每个分组重复构造
+PROCESS_TITLE_FONT = Font(bold=True, color="FF0000")
 
 
 def print_step(step_number, message):
     """打印步骤提示"""
-    time.sleep(0.25)
+    # 节奏停顿只在交互终端下保留，管道/批处理运行不再白等
+    if sys.stdout.isatty() and os.environ.get("PQA_NO_PACE") != "1":
+        time.sleep(0.25)
     print(f"\n=== {message} ===\n")
 
+# --batch 置为True后，所有交互等待都跳过，便于流水线批量调用
+BATCH_MODE = False
+
 def wait_for_enter():
-    """等待用户按回车继续"""
-    input("按回车键继续...")
-
-def find_header_row(sheet, header_keyword="片号"):
-    for row_idx, row in enumerate(sheet.iter_rows(values_only=True), 1):
-        # 确保行至少有3列，然后检查第三列（索引2）
-        if row[0] is not None:
-            if header_keyword in str(row[0]):
-                print(f"检测到表头在第 {row_idx} 行")
-                return row_idx
-    print("未找到表头，默认返回第 1 行")
-    return 1
-
-def is_valid_code(code):
-    """检查是否为有效的编码（不以#开头）"""
-    if code is None:
-        return False
-
-    code_str = str(code)
-    # 检查是否以#开头（Excel错误值通常以#开头）
-    if code_str.startswith('#'):
-        return False
-
-    return True
-
-def load_graph_data(file_path):
-    """加载Excel数据，只读取所需的列"""
-    wb = openpyxl.load_workbook(file_path)
-    sheet = wb.active
-
-    # 查找表头行
-    header_row = find_header_row(sheet)
-
-    data = []
-    for row in sheet.iter_rows(min_row=header_row + 1, values_only=True):
-        # 检查产品编码是否为有效值（不以#开头）
-        slice_code = str(row[0]) if row[0] is not None else None
-        if not is_valid_code(slice_code):
-            continue
-
-        row_data = {
-            "种类": row[1],
-            "片号": slice_code,
-            "这个缺陷": row[2],
-            "哪个缺陷": row[3],
-            "就是这个缺陷": row[4],
-
-        }
-        data.append(row_data)
-
-    return data
-
-def group_product_codes(product_codes):
+    """等待用户按回车继续（批处理模式下直接跳过）"""
+    if not BATCH_MODE:
+        input("按回车键继续...")
+
+def build_group_sheet(group_item):
     """
-    对产品编码进行分组，将亚种编码归类到基础编码
+    纯计算：把一个分组的缺陷统计转成可序列化的工作表描述
     参数:
-    product_codes: 所有产品编码的集合
+    group_item: (分组名称, 缺陷统计字典)二元组
     返回:
-    分组字典: {基础编码: [该组的所有编码]}
+    (分组名称, 表名, 数据行列表, 图表范围列表)
+    数据行形如 ("title", 工序名) / ("data", 缺陷类型, 数量, 占比) / ("blank",)
     """
-    # 找出所有编码的最小长度，这应该是基础编码的长度
-    min_length = min(len(code) for code in product_codes) if product_codes else 0
-
-    groups = {}
-
-    for code in product_codes:
-        # 提取基础编码部分（前min_length个字符）
-        base_code = code[:min_length]
-
-        if base_code not in groups:
-            groups[base_code] = []
-
-        groups[base_code].append(code)
+    group_name, defect_stats = group_item
+    sheet_name = f"{group_name}缺陷分析"
 
-    return groups
+    rows = []
+    charts = []
+    row = 2  # 表头占第1行
 
+    for process_name, counter in defect_stats.items():
+        # 工序标题行
+        rows.append(("title", process_name))
+        row += 1
 
-def analyze_defect_data(graph_data):
-    """
-    分析缺陷数据，统计各工序缺陷类型的占比
-    参数:
-    graph_data: 图形数据列表
-    返回:
-    字典，键为工序名，值为缺陷统计Counter对象
-    """
-    # 定义要分析的工序列
-    process_columns = ["这个缺陷", "哪个缺陷", "就是这个缺陷"]
+        # 记录工序数据开始行
+        process_start = row
 
-    defect_stats = {}
+        process_total = sum(counter.values())
+        for defect_type, count in counter.most_common():
+            rows.append(("data", defect_type, count,
+                         count / process_total if process_total > 0 else 0))
+            row += 1
 
-    for column in process_columns:
-        # 收集该列的所有非空值
-        defects = []
-        for item in graph_data:
-            defect = item.get(column)
-            if defect is not None and str(defect).strip() != "":
-                defects.append(str(defect).strip())
+        # 记录工序数据结束行
+        process_end = row - 1
+        if counter and process_start <= process_end:
+            charts.append({"process": process_name,
+                           "start": process_start, "end": process_end})
 
-        # 统计缺陷类型
-        defect_counter = Counter(defects)
-        defect_stats[column] = defect_counter
+        # 添加空行分隔不同工序
+        rows.append(("blank",))
+        row += 1
 
-    return defect_stats
+    return group_name, sheet_name, rows, charts
 
 
-def create_pie_charts_for_group(workbook, group_name, defect_stats):
+def write_group_sheet(workbook, payload):
     """
-    为单个产品编码分组创建饼图并添加到工作簿
+    把build_group_sheet产出的工作表描述写入工作簿并创建饼图
     参数:
     workbook: openpyxl工作簿对象
-    group_name: 分组名称
-    defect_stats: 缺陷统计字典
+    payload: build_group_sheet的返回值
     """
-    # 创建工作表
-    sheet_name = f"{group_name}缺陷分析"
-    if sheet_name in workbook.sheetnames:
-        # 如果已存在，则删除原有工作表
-        del workbook[sheet_name]
+    group_name, sheet_name, rows, charts = payload
+
+    # 创建工作表（调用方使用的是全新工作簿，分组名不会重复，无需查重删除）
     ws = workbook.create_sheet(title=sheet_name)
 
     # 添加表头
@@ -144,66 +100,32 @@ def create_pie_charts_for_group(workbook, group_name, defect_stats):
         ws[cell].font = Font(bold=True)
         ws[cell].fill = PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
 
-    # 添加数据
-    total_count = sum(sum(counter.values()) for counter in defect_stats.values())
+    # 添加数据（append整行写入，避免逐格坐标字符串解析）
     row = 2
-
-    # 记录每个工序的数据范围
-    process_ranges = {}
-
-    for process_name, counter in defect_stats.items():
-        # 添加工序标题
-        ws[f'A{row}'] = f"{process_name}"
-        ws[f'A{row}'].font = Font(bold=True, color="FF0000")
-        row += 1
-
-        # 记录工序数据开始行
-        process_start = row
-
-        process_total = sum(counter.values())
-        for defect_type, count in counter.most_common():
-            ws[f'A{row}'] = defect_type
-            ws[f'B{row}'] = count
-            ws[f'C{row}'] = count / process_total if process_total > 0 else 0
-            row += 1
-
-        # 记录工序数据结束行
-        process_end = row - 1
-        process_ranges[process_name] = (process_start, process_end)
-
-        # 添加空行分隔不同工序
+    for entry in rows:
+        if entry[0] == "title":
+            ws.append((entry[1],))
+            ws.cell(row=row, column=1).font = PROCESS_TITLE_FONT
+        elif entry[0] == "data":
+            ws.append(entry[1:])
+            # 写入时直接挂百分比样式，不再整列二次遍历
+            ws.cell(row=row, column=3).style = "pct"
+        else:
+            ws.append(())
         row += 1
 
-    # 设置百分比格式
-    for r in range(2, row):
-        if ws[f'C{r}'].value is not None:
-            ws[f'C{r}'].number_format = '0.00%'
-
     # 为每个工序创建饼图
     chart_row = 2
     chart_col = 5  # 从E列开始放置图表
 
-    for process_name, counter in defect_stats.items():
-        if not counter:  # 跳过空数据
-            continue
-
-        # 获取工序数据范围
-        if process_name not in process_ranges:
-            continue
-
-        data_start, data_end = process_ranges[process_name]
-
-        # 如果没有有效数据，跳过
-        if data_start > data_end:
-            continue
-
+    for spec in charts:
         # 创建饼图
         chart = PieChart()
-        chart.title = f"{group_name}-{process_name}缺陷分布"
+        chart.title = f"{group_name}-{spec['process']}缺陷分布"
 
         # 设置数据范围
-        labels = Reference(ws, min_col=1, min_row=data_start, max_row=data_end)
-        data = Reference(ws, min_col=2, min_row=data_start, max_row=data_end)
+        labels = Reference(ws, min_col=1, min_row=spec["start"], max_row=spec["end"])
+        data = Reference(ws, min_col=2, min_row=spec["start"], max_row=spec["end"])
 
         chart.add_data(data, titles_from_data=False)
         chart.set_categories(labels)
@@ -216,7 +138,7 @@ def create_pie_charts_for_group(workbook, group_name, defect_stats):
         chart.dataLabels.showCatName = True
 
         # 将图表添加到工作表
-        ws.add_chart(chart, f"{openpyxl.utils.get_column_letter(chart_col)}{chart_row}")
+        ws.add_chart(chart, f"{COL_LETTER[chart_col]}{chart_row}")
 
         # 更新下一个图表位置
         chart_col += 8  # 每个图表占8列宽度
@@ -230,20 +152,31 @@ def create_pie_charts_for_group(workbook, group_name, defect_stats):
     ws.column_dimensions['C'].width = 10
 
 
+def save_grouped_results_to_excel(graph_data, output_file="工序缺陷统计.xlsx"):
+    """分析各分组缺陷并保存到Excel文件"""
+    # 一次pass统计所有分组的缺陷分布
+    grouped_stats = analyze_grouped_defects(graph_data)
 
-def save_grouped_results_to_excel(grouped_data, output_file="工序缺陷统计.xlsx"):
-    """将分组结果保存到Excel文件"""
     # 创建新的工作簿
     workbook = openpyxl.Workbook()
 
+    # 全工作簿共享一个百分比命名样式，各工作表写数据时直接引用
+    workbook.add_named_style(NamedStyle(name="pct", number_format='0.00%'))
+
     # 删除默认创建的工作表
     if "Sheet" in workbook.sheetnames:
         del workbook["Sheet"]
 
-    # 为每个分组创建工作表并添加饼图
-    for group_name, data in grouped_data.items():
-        defect_stats = analyze_defect_data(data)
-        create_pie_charts_for_group(workbook, group_name, defect_stats)
+    # 每个分组的工作表内容是纯计算且相互独立，分组多时用子进程并行构建；
+    # 工作簿对象不支持并发写入，落盘仍在主进程串行完成
+    if len(grouped_stats) >= PARALLEL_GROUP_THRESHOLD:
+        with ProcessPoolExecutor() as executor:
+            payloads = list(executor.map(build_group_sheet, grouped_stats.items()))
+    else:
+        payloads = [build_group_sheet(item) for item in grouped_stats.items()]
+
+    for payload in payloads:
+        write_group_sheet(workbook, payload)
 
     # 创建汇总工作表
     summary_sheet = workbook.create_sheet(title="汇总")
@@ -256,12 +189,14 @@ def save_grouped_results_to_excel(grouped_data, output_file="工序缺陷统计.
         summary_sheet[cell].font = Font(bold=True)
         summary_sheet[cell].fill = PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
 
-    # 添加汇总数据
+    # 添加汇总数据（一次聚合得到每组行数和去重种类，避免逐组重扫）
+    group_summary = graph_data.groupby("基础编码", sort=False).agg(
+        rows=("种类", "size"), species=("种类", "unique"))
     row = 2
-    for group_name, data in grouped_data.items():
+    for group_name, info in group_summary.iterrows():
         summary_sheet[f'A{row}'] = group_name
-        summary_sheet[f'B{row}'] = len(data)
-        summary_sheet[f'C{row}'] = ", ".join(set([item["种类"] for item in data]))
+        summary_sheet[f'B{row}'] = int(info["rows"])
+        summary_sheet[f'C{row}'] = ", ".join(s for s in info["species"] if pd.notna(s))
         row += 1
 
     # 调整列宽
@@ -276,74 +211,84 @@ def save_grouped_results_to_excel(grouped_data, output_file="工序缺陷统计.
 
 # 主程序
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="工艺缺陷分布分析")
+    parser.add_argument("--batch", action="store_true",
+                        help="批处理模式：跳过所有交互等待")
+    parser.add_argument("--input", help="要分析的Excel文件路径")
+    parser.add_argument("--output", help="结果输出文件路径")
+    args = parser.parse_args()
+    BATCH_MODE = args.batch
+
     print_step(1, "工艺缺陷分布")
     print("请确保Excel文件与此程序在同一文件夹中")
     wait_for_enter()
 
     # 查找Excel文件
     print_step(2, "查找Excel文件")
-    excel_files = []
-    for file in os.listdir('.'):
-        if file.endswith('.xlsx') or file.endswith('.xls'):
-            excel_files.append(file)
-
-    if not excel_files:
-        print("未找到Excel文件(.xlsx或.xls)")
-        print("请将Excel文件放入与此程序相同的文件夹中")
-        input("按回车键退出...")
-        sys.exit(1)
-
-    # 如果找到多个Excel文件，让用户选择
-    if len(excel_files) > 1:
-        print_step(3, "发现多个Excel文件，请选择要分析的文件:")
-        for i, file in enumerate(excel_files, 1):
-            print(f"{i}. {file}")
-
-        while True:
-            try:
-                choice = int(input("请输入文件编号: "))
-                if 1 <= choice <= len(excel_files):
-                    file_path = excel_files[choice - 1]
-                    break
-                else:
-                    print("编号无效，请重新输入")
-            except ValueError:
-                print("请输入有效数字")
+    if args.input:
+        file_path = args.input
+        print(f"使用指定文件: {file_path}")
     else:
-        file_path = excel_files[0]
-        print(f"找到文件: {file_path}")
-        wait_for_enter()
+        excel_files = []
+        for file in os.listdir('.'):
+            if file.endswith('.xlsx') or file.endswith('.xls'):
+                excel_files.append(file)
+
+        if not excel_files:
+            print("未找到Excel文件(.xlsx或.xls)")
+            print("请将Excel文件放入与此程序相同的文件夹中")
+            if not BATCH_MODE:
+                input("按回车键退出...")
+            sys.exit(1)
+
+        # 如果找到多个Excel文件，让用户选择
+        if len(excel_files) > 1:
+            if BATCH_MODE:
+                print("批处理模式下发现多个Excel文件，请用 --input 指定")
+                sys.exit(1)
+
+            print_step(3, "发现多个Excel文件，请选择要分析的文件:")
+            for i, file in enumerate(excel_files, 1):
+                print(f"{i}. {file}")
+
+            while True:
+                try:
+                    choice = int(input("请输入文件编号: "))
+                    if 1 <= choice <= len(excel_files):
+                        file_path = excel_files[choice - 1]
+                        break
+                    else:
+                        print("编号无效，请重新输入")
+                except ValueError:
+                    print("请输入有效数字")
+        else:
+            file_path = excel_files[0]
+            print(f"找到文件: {file_path}")
+            wait_for_enter()
 
     print_step(4, "开始分析数据")
     print("正在读取和分析Excel文件...")
 
     try:
-        # 加载数据
-        graph_data = load_graph_data(file_path)
-
-        # 提取所有产品编码
-        all_product_codes = set(item["种类"] for item in graph_data)
-        print(f"找到 {len(all_product_codes)} 个不同的种类")
-        groups = group_product_codes(all_product_codes)
-        print(f"产品编码被分为 {len(groups)} 个组")
-
-        # 按分组组织数据
-        grouped_data = {}
-        for group_name, product_codes in groups.items():
-            grouped_data[group_name] = [
-                item for item in graph_data
-                if item["种类"] in product_codes
-            ]
-            print(f"分组 '{group_name}' 包含 {len(grouped_data[group_name])} 条数据")
+        # 加载数据（共享模块缓存解析结果，附带基础编码列）
+        graph_data = load_defects(file_path)
+
+        print(f"找到 {graph_data['种类'].nunique()} 个不同的种类")
+        print(f"产品编码被分为 {graph_data['基础编码'].nunique()} 个组")
+
+        for group_name, size in graph_data.groupby("基础编码", sort=False).size().items():
+            print(f"分组 '{group_name}' 包含 {size} 条数据")
 
         print_step(6, "分析缺陷数据")
         # 保存到Excel
-        output_file = "工序缺陷统计.xlsx"
-        save_grouped_results_to_excel(grouped_data, output_file)
+        output_file = args.output or "工序缺陷统计.xlsx"
+        save_grouped_results_to_excel(graph_data, output_file)
 
         print_step(7, "完成")
         print("所有操作已完成!")
-        print("您可以在同一文件夹中找到 '工序缺陷统计.xlsx' 文件")
+        print(f"您可以在同一文件夹中找到 '{output_file}' 文件")
         print("文件中包含了各产品分组的缺陷分析饼图")
 
     except Exception as e:
@@ -352,4 +297,5 @@ if __name__ == "__main__":
 
         traceback.print_exc()
 
-    input("按回车键退出程序...")
\ No newline at end of file
+    if not BATCH_MODE:
+        input("按回车键退出程序...")
\ No newline at end of file
@@ -0,0 +1,120 @@
+"""两个绘图脚本共用的数据读取与缺陷统计层
+
+defect_graph 与 grouped_defect_pareto_chart 原先各自维护一份几乎相同的
+读取/分组/统计代码，对同一个工作簿先后跑两种报表时文件会被解析两次。
+这里集中成一个模块，并用带文件修改时间的缓存让一次解析服务多个报表。
+"""
+import os
+from collections import Counter
+from functools import lru_cache
+
+import pandas as pd
+
+# 所需列的统一列名（按列位置重命名，不依赖文件里的原始表头）
+GRAPH_COLUMNS = ["片号", "种类", "这个缺陷", "哪个缺陷", "就是这个缺陷"]
+
+# 要分析的工序列
+PROCESS_COLUMNS = ["这个缺陷", "哪个缺陷", "就是这个缺陷"]
+
+
+def find_header_row(file_path, header_keyword="片号"):
+    """在文件前20行中查找表头所在行（1开始计数）"""
+    preview = pd.read_excel(file_path, nrows=20, header=None, engine="openpyxl")
+    for row_idx, value in enumerate(preview.iloc[:, 0], 1):
+        if value is not None and header_keyword in str(value):
+            print(f"检测到表头在第 {row_idx} 行")
+            return row_idx
+    print("未找到表头，默认返回第 1 行")
+    return 1
+
+
+@lru_cache(maxsize=4)
+def _load_defects_cached(file_path, mtime):
+    """实际的读取逻辑，mtime参与缓存键使文件更新后缓存自动失效"""
+    # 查找表头行
+    header_row = find_header_row(file_path)
+
+    # pandas按列批量构建数据，避免逐行逐格的Python循环
+    df = pd.read_excel(file_path, header=header_row - 1, usecols="A:E",
+                       dtype="string", engine="openpyxl")
+    df.columns = GRAPH_COLUMNS
+
+    # 过滤无效的片号（空值或以#开头的Excel错误值）
+    df = df[df["片号"].notna() & ~df["片号"].str.startswith("#", na=False)]
+
+    return assign_base_codes(df)
+
+
+def load_defects(file_path):
+    """加载Excel缺陷数据，返回带"基础编码"列的DataFrame（结果带缓存）"""
+    return _load_defects_cached(file_path, os.path.getmtime(file_path))
+
+
+def assign_base_codes(df):
+    """
+    计算每行的基础编码，将亚种编码归类到基础编码
+    最短种类编码的长度即基础编码长度，亚种为基础编码加后缀
+    参数:
+    df: 图形数据DataFrame
+    返回:
+    带"基础编码"列的DataFrame
+    """
+    species = df["种类"].dropna()
+    min_length = int(species.str.len().min()) if not species.empty else 0
+
+    # 向量化切片，之后一次groupby即可完成分组
+    df["基础编码"] = df["种类"].str.slice(0, min_length)
+    return df
+
+
+def analyze_grouped_defects(graph_data):
+    """
+    一次性统计所有分组各工序缺陷类型的占比
+    参数:
+    graph_data: 带"基础编码"列的图形数据DataFrame
+    返回:
+    嵌套字典 {基础编码: {工序名: Counter}}
+    """
+    base_codes = graph_data["基础编码"].dropna().unique()
+    grouped_stats = {
+        base: {column: Counter() for column in PROCESS_COLUMNS}
+        for base in base_codes
+    }
+
+    # 每列一次分组计数，替换逐组重扫数据的多次pass
+    for column in PROCESS_COLUMNS:
+        cleaned = graph_data[column].str.strip().replace("", pd.NA)
+        counts = cleaned.groupby(graph_data["基础编码"], sort=False).value_counts()
+        # 每组一次update批量灌入Counter，避免逐元素赋值的Python循环
+        for base, sub in counts.groupby(level=0, sort=False):
+            grouped_stats[base][column].update(
+                dict(zip(sub.index.get_level_values(1), sub.tolist())))
+
+    return grouped_stats
+
+
+def main():
+    """一次解析同时产出饼图和帕累托两份报表"""
+    import sys
+
+    if len(sys.argv) > 1:
+        file_path = sys.argv[1]
+    else:
+        excel_files = [f for f in os.listdir('.')
+                       if f.endswith('.xlsx') or f.endswith('.xls')]
+        if len(excel_files) != 1:
+            print("用法: python pqa_io.py <excel文件>")
+            sys.exit(1)
+        file_path = excel_files[0]
+
+    # 两个报表共享同一次解析结果（load_defects带缓存）
+    import defect_graph
+    import grouped_defect_pareto_chart
+
+    graph_data = load_defects(file_path)
+    defect_graph.save_grouped_results_to_excel(graph_data)
+    grouped_defect_pareto_chart.save_grouped_results_to_excel(graph_data)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,56 @@
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment
+import numpy as np
 import os
 import sys
-import time
+import zipfile
+from array import array
+from xml.etree.ElementTree import iterparse
+
+# numba为可选依赖：装了就用JIT内核做占比累加，没装则退回pandas groupby
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+
+if HAS_NUMBA:
+    # 显式签名使编译在导入时完成并落盘缓存(__pycache__/*.nbi/.nbc)，
+    # 首次运行之后编译成本摊销为毫秒级的缓存加载
+    @njit("void(int32[:], bool_[:, :], bool_[:, :], int64[:, :], int64[:, :])",
+          cache=True)
+    def _accumulate_ratios(cat_codes, valid, hit, totals, counts):
+        """单遍累加每(分组, 工序)的有效数与命中数
+
+        cat_codes: 每行的分组整数编码(int32)，-1表示无分组
+        valid/hit: (工序数, 行数)的布尔位图
+        totals/counts: (分组数, 工序数)的输出计数，调用方置零
+        """
+        num_configs = valid.shape[0]
+        for i in range(cat_codes.shape[0]):
+            c = cat_codes[i]
+            if c < 0:
+                continue
+            for p in range(num_configs):
+                if valid[p, i]:
+                    totals[c, p] += 1
+                    if hit[p, i]:
+                        counts[c, p] += 1
 
 def print_step(step_number, message):
     """打印步骤提示"""
-    time.sleep(0.5)
     print(f"\n=== {message} ===\n")
 
+
+# --batch 置为True后，所有交互等待都跳过，便于流水线批量调用
+BATCH_MODE = False
+
+
 def wait_for_enter():
-    """等待用户按回车继续"""
-    input("按回车键继续...")
+    """等待用户按回车继续（批处理模式下直接跳过）"""
+    if not BATCH_MODE:
+        input("按回车键继续...")
 
 
-def find_header_row(sheet, header_keyword="种类"):
-    for row_idx, row in enumerate(sheet.iter_rows(values_only=True), 1):
-        for cell_value in row:
-            if cell_value and header_keyword in str(cell_value):
-                print(f"检测到表头在第 {row_idx} 行")
-                return row_idx
-    print("未找到表头，默认返回第 1 行")
-    return 1
 def is_valid_product_code(code):
     """检查是否为有效的产品编码（不以#开头）"""
     if code is None:
@@ -35,114 +64,80 @@ def is_valid_product_code(code):
     return True
 
 
-def load_data(file_path):
-    """加载Excel数据，只读取第1、3、6、8列"""
-    wb = openpyxl.load_workbook(file_path)
-    sheet = wb.active
-
-    # 查找表头行
-    header_row = find_header_row(sheet)
-
-    data = []
-    for row in sheet.iter_rows(min_row=header_row + 1, values_only=True):
-        # 跳过空行
-        if row[0] is None:
-            continue
-
-        category = str(row[0]) if row[0] is not None else None
-
-        if not is_valid_product_code(category):
-            continue
-
-        row_data = {
-            "种类": category,  # 第1列
-            "工序1品质": row[2],  # 第3列
-            "工序2品质": row[5],  # 第6列
-            "最终品质": row[7]  # 第8列
-        }
-        data.append(row_data)
-
-    return data
-
-
-def preprocess_data(data):
-    """预处理数据，填充最终品质的空值"""
-    for item in data:
-        # 如果最终品质为空，则根据工序2品质填充
-        final_quality = item.get("最终品质")
-        if final_quality is None or final_quality == "":
-            process2_quality = item.get("工序2品质")
-            if process2_quality == "好":
-                item["最终品质"] = "好"
-            else:
-                item["最终品质"] = "坏"
-    return data
-
-## this is just an example
-
-def quality_ratio(data, category, process_column, values_to_count, consider_empty=False):
-    """
-    计算指定种类、指定工序中特定值的占比
-    参数:
-    data: 数据集
-    category: 产品种类
-    process_column: 工序列名
-    values_to_count: 要计算的值列表(如["好", "一般"])
-    consider_empty: 是否考虑空值
-    """
-    if isinstance(category, str):
-        categories = [category]
-    else:
-        categories = category
-    total = 0
-    count = 0
-
-    for item in data:
-        if item.get("种类") == category:
-            value = item.get(process_column)
-
-            if value is None or value == "":
-                continue
-            total += 1
-
-            if value in values_to_count:
-                count += 1
-            # 如果考虑空值且值为空，则根据情况处理
-            elif consider_empty and (value is None or value == ""):
-                # 这里可以根据需要决定是否将空值计入特定类别
-                pass
-
-    return count / total if total > 0 else 0
-def group_category(categories):
+# xlsx内部XML的命名空间与所需列（A/C/F/H对应第1、3、6、8列）
+_SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_WANTED_COLS = {"A": 0, "C": 1, "F": 2, "H": 3}
+
+
+def _load_shared_strings(zf):
+    """流式读取共享字符串表，返回按索引排列的字符串列表"""
+    strings = []
+    if "xl/sharedStrings.xml" not in zf.namelist():
+        return strings
+    with zf.open("xl/sharedStrings.xml") as fh:
+        for _, elem in iterparse(fh):
+            if elem.tag == _SHEET_NS + "si":
+                # 富文本由多段<t>组成，拼接后才是完整字符串
+                strings.append("".join(t.text or "" for t in elem.iter(_SHEET_NS + "t")))
+                elem.clear()
+    return strings
+
+
+def _cell_value(cell, shared_strings):
+    """解析单元格XML节点的值，尽量与openpyxl的取值行为保持一致"""
+    cell_type = cell.get("t")
+    if cell_type == "inlineStr":
+        return "".join(t.text or "" for t in cell.iter(_SHEET_NS + "t"))
+
+    v = cell.find(_SHEET_NS + "v")
+    if v is None or v.text is None:
+        return None
+    if cell_type == "s":
+        return shared_strings[int(v.text)]
+    if cell_type == "str":
+        # 公式缓存的字符串结果
+        return v.text
+    if cell_type == "b":
+        return v.text == "1"
+    # 数值：整数还原为int
+    number = float(v.text)
+    return int(number) if number.is_integer() else number
+
+
+def iter_quality_rows(file_path):
     """
-    对于问题所处的实际情况，种类一般字符长度一致，存在亚种则在基础种类添加后缀，但最终计算仍为一个种类
-    对种类进行分组，将亚种编码归类到基础编码
-    参数:
-    categoriess: 所有种类的集合
-    返回:
-    分组字典: {基础编码: [该组的所有种类]}
+    绕过openpyxl，直接用zipfile+iterparse流式解析xlsx内部XML
+    逐行产出 (行号, (第1列, 第3列, 第6列, 第8列))
+    只读模式的openpyxl仍会构建工作簿对象、包装每个单元格，
+    这里只取4列标量值，省掉整个对象层
     """
-    # 找出所有编码的最小长度，这应该是基础编码的长度
-    min_length = min(len(code) for code in categories) if categories else 0
-
-    groups = {}
-
-    for code in categories:
-        # 提取基础编码部分（前min_length个字符）
-        base_code = code[:min_length]
-
-        if base_code not in groups:
-            groups[base_code] = []
-
-        groups[base_code].append(code)
-
-    return groups
-
+    with zipfile.ZipFile(file_path) as zf:
+        shared_strings = _load_shared_strings(zf)
+        sheet_names = sorted(name for name in zf.namelist()
+                             if name.startswith("xl/worksheets/sheet"))
+        with zf.open(sheet_names[0]) as fh:
+            for _, elem in iterparse(fh):
+                if elem.tag != _SHEET_NS + "row":
+                    continue
+                values = [None, None, None, None]
+                for cell in elem:
+                    if cell.tag != _SHEET_NS + "c":
+                        continue
+                    # 单元格引用形如"C5"，去掉行号得到列字母
+                    letter = cell.get("r", "").rstrip("0123456789")
+                    idx = _WANTED_COLS.get(letter)
+                    if idx is not None:
+                        values[idx] = _cell_value(cell, shared_strings)
+                row_idx = int(elem.get("r", 0))
+                # 释放已处理的行节点，内存保持O(行)
+                elem.clear()
+                yield row_idx, tuple(values)
 
 
 def analyze_quality_data(quality_file_path, process_configs):
     """
-    分析质量数据
+    单遍流式分析质量数据：边读边把每行折叠成整数编码和有效/命中位图，
+    种类、品质等字符串列从不整列驻留内存（原 加载→回填→分析 三遍结构的融合版）
     参数:
     file_path: Excel文件路径
     process_configs: 工序配置列表，每个配置是一个字典，包含:
@@ -150,75 +145,144 @@ def analyze_quality_data(quality_file_path, process_configs):
         - column: 数据列名
         - values: 要计算的值列表
     """
-    # 加载和预处理数据
-    data = load_data(quality_file_path)
-    if not data:
-        print("未找到有效数据")
-        return {}
+    # 值列表转为frozenset，成员判断走O(1)哈希而非列表线性扫描
+    process_configs = [{**config, "values": frozenset(config["values"])}
+                       for config in process_configs]
+
+    # 配置列名 → 流式行元组里的下标
+    col_index = {"种类": 0, "工序1品质": 1, "工序2品质": 2, "最终品质": 3}
+    config_cols = [col_index[config["column"]] for config in process_configs]
+    config_values = [config["values"] for config in process_configs]
+    num_configs = len(process_configs)
+
+    header_found = False
+    header_keyword = "种类"
+
+    cat_code = {}               # 种类 → 整数编码（按首次出现顺序，流式factorize）
+    cat_codes = array("i")      # 每行的种类编码，4字节/行
+    valid_bits = [bytearray() for _ in range(num_configs)]  # 1字节/行的位图
+    hit_bits = [bytearray() for _ in range(num_configs)]
+
+    for row_idx, row in iter_quality_rows(quality_file_path):
+        if not header_found:
+            # isinstance过滤掉数值/空单元格，免去对它们的str()转换；any短路扫描
+            if any(cell_value and header_keyword in cell_value
+                   for cell_value in row if isinstance(cell_value, str)):
+                print(f"检测到表头在第 {row_idx} 行")
+                header_found = True
+            continue
 
-    data = preprocess_data(data)
+        # 跳过空行
+        if row[0] is None:
+            continue
 
-    # 获取所有种类
-    categories = set()
-    for item in data:
-        category = item.get("种类")
-        if category is not None:
-            categories.add(category)
-    category_groups = group_category(categories)
-    results = {}
+        category = str(row[0])
+        if not is_valid_product_code(category):
+            continue
+
+        values = list(row)
+        # 最终品质空值按工序2品质就地补全（原preprocess_data融合进同一遍）
+        if values[3] is None or values[3] == "":
+            values[3] = "好" if values[2] == "好" else "坏"
+
+        cat_codes.append(cat_code.setdefault(category, len(cat_code)))
+        for p, col in enumerate(config_cols):
+            value = values[col]
+            is_valid = value is not None and value != ""
+            valid_bits[p].append(is_valid)
+            hit_bits[p].append(is_valid and value in config_values[p])
+
+    if not header_found:
+        print("未找到表头，无数据可读")
+    if not cat_codes:
+        print("未找到有效数据")
+        return {}
 
-    for base_code, code_list in category_groups.items():
-        group_results = {}
+    categories = list(cat_code)
+    codes = np.frombuffer(cat_codes, dtype=np.intc).astype(np.int32, copy=False)
+    valid = np.stack([np.frombuffer(bits, dtype=np.bool_) for bits in valid_bits])
+    hit = np.stack([np.frombuffer(bits, dtype=np.bool_) for bits in hit_bits])
 
-        # 为每个工序配置计算占比
-        for config in process_configs:
-            ratio = quality_ratio(data, category, config["column"], config["values"])
-            group_results[config["name"]] = ratio
+    totals = np.zeros((len(categories), num_configs), dtype=np.int64)
+    counts = np.zeros_like(totals)
 
-        results[base_code] = group_results
+    if HAS_NUMBA:
+        # JIT内核对位图做单遍累加
+        _accumulate_ratios(codes, valid, hit, totals, counts)
+    else:
+        # 无numba时退回numpy：逐工序按编码bincount
+        for p in range(num_configs):
+            totals[:, p] = np.bincount(codes[valid[p]], minlength=len(categories))
+            counts[:, p] = np.bincount(codes[hit[p]], minlength=len(categories))
+
+    # 种类一般字符长度一致，亚种在基础种类后添加后缀；
+    # 最短种类长度即基础编码长度。基础编码只依赖去重后的种类清单，
+    # 按它把各种类的计数行合并进所属分组，再统一算占比
+    min_length = min(len(category) for category in categories)
+    base_totals = {}
+    for g, category in enumerate(categories):
+        base_code = category[:min_length]
+        if base_code not in base_totals:
+            base_totals[base_code] = [np.zeros(num_configs, dtype=np.int64),
+                                      np.zeros(num_configs, dtype=np.int64)]
+        base_totals[base_code][0] += totals[g]
+        base_totals[base_code][1] += counts[g]
 
+    results = {}
+    for base_code, (group_totals, group_counts) in base_totals.items():
+        results[base_code] = {
+            config["name"]:
+                float(group_counts[p] / group_totals[p]) if group_totals[p] > 0 else 0
+            for p, config in enumerate(process_configs)
+        }
     return results
 
 def save_results_to_excel(results, process_configs, output_file="质量分析结果.xlsx"):
     """将结果保存到Excel文件"""
-    # 创建新的工作簿
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "质量分析结果"
+    # 读取侧已不走openpyxl，导入推迟到真正要写文件时，启动不再预付导入开销
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill, Alignment, NamedStyle
+
+    # 只写流式模式：逐行落盘，内存占用从O(表)降为O(行)，与读取侧的只读模式对称
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("质量分析结果")
 
-    # 设置标题行
     headers = ["种类"]
     for config in process_configs:
         headers.append(config["name"])
 
-    for col_idx, header in enumerate(headers, 1):
-        cell = sheet.cell(row=1, column=col_idx, value=header)
-        cell.font = Font(bold=True, color="FFFFFF")
-        cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-
-    # 填充数据
-    row_idx = 2
+    # 流式写入不能回头改表，列宽在写入前设置；
+    # 占比列显示宽度有上界（"100.00%"共7字符），直接给定宽即可，只有种类列需要实测
+    category_width = max(len(headers[0]),
+                         max((len(str(category)) for category in results), default=0))
+    sheet.column_dimensions["A"].width = (category_width + 2) * 1.2
+    for col_idx in range(2, len(headers) + 1):
+        sheet.column_dimensions[openpyxl.utils.get_column_letter(col_idx)].width = 12
+
+    # 表头样式注册为命名样式，每格只做一次样式名赋值而非逐属性解析
+    workbook.add_named_style(NamedStyle(
+        name="header",
+        font=Font(bold=True, color="FFFFFF"),
+        fill=PatternFill(start_color="366092", end_color="366092", fill_type="solid"),
+        alignment=Alignment(horizontal="center", vertical="center"),
+    ))
+
+    header_cells = []
+    for header in headers:
+        cell = WriteOnlyCell(sheet, value=header)
+        cell.style = "header"
+        header_cells.append(cell)
+    sheet.append(header_cells)
+
+    # 逐行构建后append，占比列写入时直接挂百分比格式
     for category, ratios in results.items():
-        sheet.cell(row=row_idx, column=1, value=category)
-
-        for col_idx, config in enumerate(process_configs, 2):
-            sheet.cell(row=row_idx, column=col_idx, value=ratios[config["name"]]).number_format = '0.00%'
-
-        row_idx += 1
-
-    # 调整列宽
-    for column in sheet.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = (max_length + 2) * 1.2
-        sheet.column_dimensions[column_letter].width = adjusted_width
+        row_cells = [WriteOnlyCell(sheet, value=category)]
+        for config in process_configs:
+            cell = WriteOnlyCell(sheet, value=ratios[config["name"]])
+            cell.number_format = '0.00%'
+            row_cells.append(cell)
+        sheet.append(row_cells)
 
     # 保存文件
     workbook.save(output_file)
@@ -236,43 +300,62 @@ def print_results(results, process_configs):
 
 # 主程序
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="长晶工艺质量数据分析")
+    parser.add_argument("--batch", action="store_true",
+                        help="批处理模式：跳过所有交互等待")
+    parser.add_argument("--input", help="要分析的Excel文件路径")
+    parser.add_argument("--output", help="结果输出文件路径")
+    args = parser.parse_args()
+    BATCH_MODE = args.batch
+
     print_step(1, "长晶工艺质量数据分析")
     print("请确保Excel文件与此程序在同一文件夹中")
     wait_for_enter()
 
     # 查找Excel文件
     print_step(2, "查找Excel文件")
-    excel_files = []
-    for file in os.listdir('.'):
-        if file.endswith('.xlsx') or file.endswith('.xls'):
-            excel_files.append(file)
-
-    if not excel_files:
-        print("未找到Excel文件(.xlsx或.xls)")
-        print("请将Excel文件放入与此程序相同的文件夹中")
-        input("按回车键退出...")
-        sys.exit(1)
-
-    # 如果找到多个Excel文件，让用户选择
-    if len(excel_files) > 1:
-        print_step(3, "发现多个Excel文件，请选择要分析的文件:")
-        for i, file in enumerate(excel_files, 1):
-            print(f"{i}. {file}")
-
-        while True:
-            try:
-                choice = int(input("请输入文件编号: "))
-                if 1 <= choice <= len(excel_files):
-                    file_path = excel_files[choice - 1]
-                    break
-                else:
-                    print("编号无效，请重新输入")
-            except ValueError:
-                print("请输入有效数字")
+    if args.input:
+        file_path = args.input
+        print(f"使用指定文件: {file_path}")
     else:
-        file_path = excel_files[0]
-        print(f"找到文件: {file_path}")
-        wait_for_enter()
+        excel_files = []
+        for file in os.listdir('.'):
+            if file.endswith('.xlsx') or file.endswith('.xls'):
+                excel_files.append(file)
+
+        if not excel_files:
+            print("未找到Excel文件(.xlsx或.xls)")
+            print("请将Excel文件放入与此程序相同的文件夹中")
+            if not BATCH_MODE:
+                input("按回车键退出...")
+            sys.exit(1)
+
+        # 如果找到多个Excel文件，让用户选择
+        if len(excel_files) > 1:
+            if BATCH_MODE:
+                print("批处理模式下发现多个Excel文件，请用 --input 指定")
+                sys.exit(1)
+
+            print_step(3, "发现多个Excel文件，请选择要分析的文件:")
+            for i, file in enumerate(excel_files, 1):
+                print(f"{i}. {file}")
+
+            while True:
+                try:
+                    choice = int(input("请输入文件编号: "))
+                    if 1 <= choice <= len(excel_files):
+                        file_path = excel_files[choice - 1]
+                        break
+                    else:
+                        print("编号无效，请重新输入")
+                except ValueError:
+                    print("请输入有效数字")
+        else:
+            file_path = excel_files[0]
+            print(f"找到文件: {file_path}")
+            wait_for_enter()
 
     # 配置每个工序的参数
     process_configs = [
@@ -307,12 +390,12 @@ if __name__ == "__main__":
 
         print_step(6, "保存结果")
         # 保存到Excel
-        output_file = "质量分析结果.xlsx"
+        output_file = args.output or "质量分析结果.xlsx"
         save_results_to_excel(results, process_configs, output_file)
 
         print_step(7, "完成")
         print("所有操作已完成!")
-        print("您可以在同一文件夹中找到 '质量分析结果.xlsx' 文件")
+        print(f"您可以在同一文件夹中找到 '{output_file}' 文件")
 
     except Exception as e:
         print(f"处理过程中发生错误: {str(e)}")
@@ -320,4 +403,5 @@ if __name__ == "__main__":
 
         traceback.print_exc()
 
-    input("按回车键退出程序...")
+    if not BATCH_MODE:
+        input("按回车键退出程序...")